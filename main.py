@@ -2,15 +2,222 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import HTMLResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from starlette.responses import Response
+from contextlib import asynccontextmanager
+from email.utils import formatdate
+from functools import lru_cache
+import asyncio
+import gzip
 import os
+import re
+import stat
 import glob
 import mimetypes
 
+try:
+    from watchfiles import awatch  # Installed with uvicorn[standard]
+except ImportError:
+    awatch = None
+
+# Cached (name, display_name) pairs for the videos folder, keyed on its mtime
+_dir_cache = {"mtime": None, "data": None}
+
+# Seconds between background rescans of the videos folder when watchfiles is
+# unavailable, and between attempts to restart a watch that has stopped
+_REFRESH_INTERVAL = 2
+
+# Rendered index pages, as (html, gzipped html), keyed on (videos folder mtime,
+# base URL) and evicted FIFO
+_HTML_CACHE_SIZE = 8
+_html_cache = {}
+
+# Headers sent with every MPD served by serve_mpd_file
+_MPD_HEADERS = {
+    "Content-Type": "text/plain; charset=utf-8",
+    "Cache-Control": "public, max-age=3600",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET,POST,HEAD",
+    "Access-Control-Allow-Headers": "*"
+}
+
+# Manifests up to this size are kept in memory by _load_mpd
+_MPD_CACHE_MAX_BYTES = 64 * 1024
+
+# Indentation between MPD elements carries no meaning and is dropped when cached
+_MPD_BLANK_TEXT = re.compile(rb">\s+<")
+
+@lru_cache(maxsize=128)
+def _load_mpd(path: str, mtime_ns: int) -> tuple:
+    """Minified MPD bytes and their gzip encoding; mtime_ns is part of the cache key so edits are picked up"""
+    with open(path, "rb") as f:
+        body = _MPD_BLANK_TEXT.sub(b"><", f.read().strip())
+    # mtime=0 keeps the gzip bytes identical across rebuilds and workers,
+    # as the strong "-gz" ETag promises
+    return body, gzip.compress(body, mtime=0)
+
+def _etag_matches(if_none_match, etag: str) -> bool:
+    """Weak If-None-Match comparison, so tags weakened by gzipping proxies still match"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+# Display names per video folder, kept across listing rescans
+_UNDERSCORE_TO_SPACE = str.maketrans("_", " ")
+_display_name_cache = {}
+
+def _display_name(video_dir: str) -> str:
+    """Human readable title for a video folder name"""
+    display_name = _display_name_cache.get(video_dir)
+    if display_name is None:
+        display_name = _display_name_cache[video_dir] = video_dir.translate(_UNDERSCORE_TO_SPACE).title()
+    return display_name
+
+def _enumerate_videos(force: bool = False) -> tuple:
+    """(name, display_name) pairs, sorted by name, for every video folder with a master MPD file"""
+    # Reuse the cached listing while the videos folder is unchanged
+    mtime = os.stat("videos").st_mtime_ns
+    if force or mtime != _dir_cache["mtime"]:
+        # Find all video directories, sorted by name once here so the cached
+        # listing needs no sorting per request; DirEntry answers is_dir() without an extra stat
+        with os.scandir("videos") as it:
+            video_dirs = sorted(e.name for e in it if e.is_dir() and e.name != "export")
+        
+        # Find only master MPD files in each video directory
+        entries = []
+        for video_dir in video_dirs:
+            # Look for master MPD file that matches the directory name
+            master_mpd = f"videos/{video_dir}/{video_dir}.mpd"
+            
+            if os.path.isfile(master_mpd):
+                entries.append((video_dir, _display_name(video_dir)))
+        
+        # Publish data before mtime; readers take mtime first, so a page is
+        # never cached under a newer mtime than the listing it was built from
+        _dir_cache["data"] = tuple(entries)
+        _dir_cache["mtime"] = mtime
+    
+    return _dir_cache["data"]
+
+def _videos_data(videos: tuple, base_url: str) -> list:
+    """Video entries with MPD URLs for the requesting host, in listing (name) order"""
+    return [
+        {
+            "name": video_dir,
+            "mpd_file": f"{base_url}/videos/{video_dir}/{video_dir}.mpd",
+            "display_name": display_name
+        }
+        for video_dir, display_name in videos
+    ]
+
+async def _current_videos() -> tuple:
+    """(mtime, listing) kept warm by the lifespan task; scans off the event loop if it has not run yet"""
+    if _dir_cache["data"] is None:
+        await asyncio.to_thread(_enumerate_videos)
+    return _dir_cache["mtime"], _dir_cache["data"]
+
+async def _refresh_videos():
+    """Rescan the videos folder in a worker thread every few seconds"""
+    while True:
+        try:
+            await asyncio.to_thread(_enumerate_videos)
+        except OSError:
+            pass  # Keep serving the last listing until the folder is readable again
+        await asyncio.sleep(_REFRESH_INTERVAL)
+
+async def _stop_on_folder_swap(folder: tuple, stop_event: asyncio.Event):
+    """Set stop_event once "videos" no longer resolves to the watched (st_dev, st_ino)"""
+    while True:
+        await asyncio.sleep(_REFRESH_INTERVAL)
+        try:
+            st = await asyncio.to_thread(os.stat, "videos")
+        except OSError:
+            break  # The folder went away
+        if (st.st_dev, st.st_ino) != folder:
+            break  # The folder was swapped or its symlink repointed
+    stop_event.set()
+
+async def _watch_videos():
+    """Rebuild the listing whenever anything under the videos folder changes"""
+    while True:
+        try:
+            # inotify follows the inode, so stop the watch if "videos" is
+            # replaced by another folder and watch the new one instead
+            st = await asyncio.to_thread(os.stat, "videos")
+            stop_event = asyncio.Event()
+            guard = asyncio.create_task(_stop_on_folder_swap((st.st_dev, st.st_ino), stop_event))
+            try:
+                async for _ in awatch("videos", stop_event=stop_event):
+                    # Master MPDs can appear inside a folder without touching the parent
+                    # mtime, so force the rescan and drop pages keyed on that mtime
+                    await asyncio.to_thread(_enumerate_videos, True)
+                    _html_cache.clear()
+            finally:
+                guard.cancel()
+        except OSError:
+            pass  # The folder went away; the watch is restarted on it below
+        
+        # The watch ended, so changes may have been missed: wait for the folder,
+        # rescan it and start a fresh watch
+        await asyncio.sleep(_REFRESH_INTERVAL)
+        try:
+            await asyncio.to_thread(_enumerate_videos, True)
+        except OSError:
+            continue
+        _html_cache.clear()
+
 # Helper function to get base URL from request
 def get_base_url(request: Request) -> str:
     """Extract base URL from the request"""
-    return f"{request.url.scheme}://{request.url.netloc}"
+    url = request.url
+    return _base_url(url.scheme, url.netloc)
+
+@lru_cache(maxsize=8)
+def _base_url(scheme: str, netloc: str) -> str:
+    """Shared base URL string per scheme and host"""
+    return f"{scheme}://{netloc}"
+
+def _accepts_gzip(request: Request) -> bool:
+    """Whether the client accepts a gzip encoded body"""
+    return "gzip" in request.headers.get("accept-encoding", "")
+
+def _pregzipped_body(use_gzip: bool, body: bytes, gzip_body: bytes, headers: dict) -> bytes:
+    """Pick the plain or pre-gzipped body, setting Vary and Content-Encoding in headers"""
+    headers["Vary"] = "Accept-Encoding"
+    if use_gzip:
+        # GZipMiddleware leaves responses that already carry Content-Encoding alone
+        headers["Content-Encoding"] = "gzip"
+        return gzip_body
+    return body
+
+def _html_response(request: Request, page: tuple) -> HTMLResponse:
+    """Send a cached index page, using its pre-gzipped copy when the client accepts gzip"""
+    headers = {}
+    content = _pregzipped_body(_accepts_gzip(request), *page, headers)
+    return HTMLResponse(content=content, headers=headers)
+
+# Segments following a requested one that are read ahead into the page cache
+_PREFETCH_SEGMENTS = 2
+_SEGMENT_NAME = re.compile(r"segment_(\d+)\.m4s$")
+_CAN_FADVISE = hasattr(os, "posix_fadvise")
+
+def _prefetch_segments(directory: str, number: int):
+    """Ask the kernel to read the segments after `number` ahead of the player"""
+    for n in range(number + 1, number + 1 + _PREFETCH_SEGMENTS):
+        try:
+            fd = os.open(f"{directory}/segment_{n}.m4s", os.O_RDONLY)
+        except OSError:
+            break  # Past the last segment
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass  # Read-ahead is only a hint; the segment is still served on request
+        finally:
+            os.close(fd)
 
 # Custom static file handler that properly handles MPD files
 class CustomStaticFiles(StaticFiles):
@@ -39,83 +246,34 @@ class CustomStaticFiles(StaticFiles):
                 response.headers["Access-Control-Allow-Origin"] = "*"
                 response.headers["Access-Control-Allow-Methods"] = "GET,HEAD,OPTIONS"
                 response.headers["Access-Control-Allow-Headers"] = "*"
-                response.headers["Cache-Control"] = "public, max-age=86400"  # Cache segments longer
+                response.headers["Cache-Control"] = "public, max-age=31536000, immutable"  # Segments never change once packaged
+                
+                # Players read segments in order, so warm the page cache for the next ones
+                match = _SEGMENT_NAME.search(file_path)
+                if match and _CAN_FADVISE:
+                    asyncio.get_running_loop().run_in_executor(
+                        None, _prefetch_segments, os.path.dirname(file_path), int(match.group(1))
+                    )
             
             # Add CORS headers for MP4 files (init segments)
             elif file_path.endswith('.mp4'):
                 response.headers["Access-Control-Allow-Origin"] = "*"
                 response.headers["Access-Control-Allow-Methods"] = "GET,HEAD,OPTIONS"
                 response.headers["Access-Control-Allow-Headers"] = "*"
-                response.headers["Cache-Control"] = "public, max-age=86400"
+                response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
         
         return response
 
-app = FastAPI(title="Video Player", description="DASH Video Player with MPD files")
-
-# Add CORS middleware to handle preflight requests
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins for video segments
-    allow_credentials=True,
-    allow_methods=["*"],  # Allow all HTTP methods
-    allow_headers=["*"],  # Allow all headers
-)
-
-# Custom endpoint specifically for MPD files to ensure proper headers
-@app.get("/videos/{video_folder}/{mpd_file}")
-async def serve_mpd_file(video_folder: str, mpd_file: str):
-    """Serve MPD files with correct MIME type and headers for browser display"""
-    if not mpd_file.endswith('.mpd'):
-        raise HTTPException(status_code=404, detail="Not an MPD file")
-    
-    file_path = os.path.join("videos", video_folder, mpd_file)
-    
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(
-        path=file_path,
-        media_type="text/plain",
-        headers={
-            "Content-Type": "text/plain; charset=utf-8",
-            "Cache-Control": "public, max-age=3600",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET,POST,HEAD",
-            "Access-Control-Allow-Headers": "*"
-        }
-    )
-
-# Mount static files for other video files (segments, etc.)
-app.mount("/videos", CustomStaticFiles(directory="videos"), name="videos")
+# GZip middleware that passes media segments through untouched
+class SegmentAwareGZipMiddleware(GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith(('.m4s', '.mp4')):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
 
-@app.get("/", response_class=HTMLResponse)
-async def render_videos(request: Request):
-    """Render all videos from the videos folder with their master MPD files"""
-    
-    # Get base URL from request
-    base_url = get_base_url(request)
-    
-    # Find all video directories
-    video_dirs = [d for d in os.listdir("videos") if os.path.isdir(os.path.join("videos", d)) and d != "export"]
-    
-    # Find only master MPD files in each video directory
-    videos_data = []
-    for video_dir in video_dirs:
-        video_path = os.path.join("videos", video_dir)
-        # Look for master MPD file that matches the directory name
-        master_mpd = os.path.join(video_path, f"{video_dir}.mpd")
-        
-        if os.path.exists(master_mpd):
-            videos_data.append({
-                "name": video_dir,
-                "mpd_file": f"{base_url}/videos/{video_dir}/{video_dir}.mpd",
-                "display_name": video_dir.replace("_", " ").title()
-            })
-    
-    # Sort videos by name
-    videos_data.sort(key=lambda x: x["name"])
-    
-    html_content = f"""
+# Static page markup around the video cards, encoded once at import time
+_HTML_HEAD = """
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -124,58 +282,58 @@ async def render_videos(request: Request):
         <title>Video Player - DASH Videos</title>
         <script src="https://cdn.dashjs.org/latest/dash.all.min.js"></script>
         <style>
-            body {{
+            body {
                 font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
                 margin: 0;
                 padding: 20px;
                 background-color: #f5f5f5;
-            }}
-            .container {{
+            }
+            .container {
                 max-width: 1200px;
                 margin: 0 auto;
                 background: white;
                 border-radius: 10px;
                 box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
                 padding: 30px;
-            }}
-            h1 {{
+            }
+            h1 {
                 text-align: center;
                 color: #333;
                 margin-bottom: 30px;
                 border-bottom: 3px solid #007bff;
                 padding-bottom: 10px;
-            }}
-            .video-grid {{
+            }
+            .video-grid {
                 display: grid;
                 grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
                 gap: 20px;
                 margin-top: 20px;
-            }}
-            .video-card {{
+            }
+            .video-card {
                 border: 1px solid #ddd;
                 border-radius: 8px;
                 padding: 15px;
                 background: #fafafa;
                 transition: transform 0.2s, box-shadow 0.2s;
-            }}
-            .video-card:hover {{
+            }
+            .video-card:hover {
                 transform: translateY(-2px);
                 box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-            }}
-            .video-title {{
+            }
+            .video-title {
                 font-weight: bold;
                 color: #333;
                 margin-bottom: 10px;
                 font-size: 16px;
-            }}
-            .video-player {{
+            }
+            .video-player {
                 width: 100%;
                 height: 200px;
                 background: #000;
                 border-radius: 4px;
                 margin-bottom: 10px;
-            }}
-            .play-button {{
+            }
+            .play-button {
                 background: #007bff;
                 color: white;
                 border: none;
@@ -185,47 +343,44 @@ async def render_videos(request: Request):
                 width: 100%;
                 font-size: 14px;
                 transition: background-color 0.2s;
-            }}
-            .play-button:hover {{
+            }
+            .play-button:hover {
                 background: #0056b3;
-            }}
-            .mpd-info {{
+            }
+            .mpd-info {
                 font-size: 12px;
                 color: #666;
                 margin-top: 5px;
-            }}
-            .no-videos {{
+            }
+            .no-videos {
                 text-align: center;
                 color: #666;
                 font-style: italic;
                 margin-top: 50px;
-            }}
+            }
         </style>
     </head>
     <body>
         <div class="container">
             <h1>🎬 DASH Video Player</h1>
             <div class="video-grid">
-    """
-    
-    if not videos_data:
-        html_content += '<div class="no-videos">No videos found in the videos folder.</div>'
-    else:
-        for i, video in enumerate(videos_data):
-            html_content += f"""
+    """.encode("utf-8")
+
+# Markup for a single video card: display name, card index twice, MPD URL twice
+_CARD_FMT = """
                 <div class="video-card">
-                    <div class="video-title">{video['display_name']}</div>
-                    <video id="player{i}" class="video-player" controls preload="none">
+                    <div class="video-title">%s</div>
+                    <video id="player%d" class="video-player" controls preload="none">
                         Your browser does not support the video tag.
                     </video>
-                    <button class="play-button" onclick="loadVideo({i}, '{video['mpd_file']}')">
+                    <button class="play-button" onclick="loadVideo(%d, '%s')">
                         ▶ Play Video
                     </button>
-                    <div class="mpd-info">MPD: {video['mpd_file']}</div>
+                    <div class="mpd-info">MPD: %s</div>
                 </div>
             """
-    
-    html_content += """
+
+_HTML_TAIL = """
             </div>
         </div>
         
@@ -262,9 +417,117 @@ async def render_videos(request: Request):
         </script>
     </body>
     </html>
-    """
+    """.encode("utf-8")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Index the videos once, then keep the listing warm so request handlers
+    # never touch the filesystem
+    await asyncio.to_thread(_enumerate_videos)
+    refresh_task = asyncio.create_task(_watch_videos() if awatch else _refresh_videos())
+    yield
+    refresh_task.cancel()
+
+app = FastAPI(title="Video Player", description="DASH Video Player with MPD files", lifespan=lifespan)
+
+# Add CORS middleware to handle preflight requests
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # Allow all origins for video segments
+    allow_credentials=True,
+    allow_methods=["*"],  # Allow all HTTP methods
+    allow_headers=["*"],  # Allow all headers
+)
+
+# Compress the index page, API and manifests; media segments are already compressed
+app.add_middleware(SegmentAwareGZipMiddleware, minimum_size=512)
+
+# Custom endpoint specifically for MPD files to ensure proper headers; the
+# .mpd suffix is part of the route so every other file falls through to the mount
+@app.get("/videos/{video_folder}/{mpd_name}.mpd")
+async def serve_mpd_file(request: Request, video_folder: str, mpd_name: str):
+    """Serve MPD files with correct MIME type and headers for browser display"""
+    file_path = f"videos/{video_folder}/{mpd_name}.mpd"
     
-    return HTMLResponse(content=html_content)
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not stat.S_ISREG(st.st_mode):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # Small manifests are served minified from memory, pre-gzipped when accepted;
+    # large ones are gzipped on the way out by GZipMiddleware
+    cached = st.st_size <= _MPD_CACHE_MAX_BYTES
+    use_gzip = _accepts_gzip(request)
+    
+    # Let players revalidate polled manifests without resending the body; the
+    # gzip variant gets its own tag
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}{"-gz" if use_gzip else ""}"'
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=304,
+            headers={
+                "ETag": etag,
+                "Cache-Control": _MPD_HEADERS["Cache-Control"],
+                "Vary": "Accept-Encoding"
+            }
+        )
+    
+    headers = dict(_MPD_HEADERS)
+    headers["ETag"] = etag
+    
+    # Large manifests are streamed from disk instead of being held in memory
+    if not cached:
+        if not use_gzip:
+            headers["Vary"] = "Accept-Encoding"  # GZipMiddleware adds it when it compresses
+        # Reuse our stat so FileResponse does not stat the file again
+        return FileResponse(path=file_path, media_type="text/plain", headers=headers, stat_result=st)
+    
+    headers["Last-Modified"] = formatdate(st.st_mtime, usegmt=True)
+    body = _pregzipped_body(use_gzip, *_load_mpd(file_path, st.st_mtime_ns), headers)
+    
+    return Response(
+        content=body,
+        media_type="text/plain",
+        headers=headers
+    )
+
+# Mount static files for other video files (segments, etc.)
+app.mount("/videos", CustomStaticFiles(directory="videos"), name="videos")
+
+@app.get("/", response_class=HTMLResponse)
+async def render_videos(request: Request):
+    """Render all videos from the videos folder with their master MPD files"""
+    
+    # Get base URL from request
+    base_url = get_base_url(request)
+    
+    # Serve the already rendered page for this listing and host
+    mtime, videos = await _current_videos()
+    html_key = (mtime, base_url)
+    if html_key in _html_cache:
+        return _html_response(request, _html_cache[html_key])
+    
+    videos_data = _videos_data(videos, base_url)
+    
+    if not videos_data:
+        cards = '<div class="no-videos">No videos found in the videos folder.</div>'
+    else:
+        parts = [
+            _CARD_FMT % (video["display_name"], i, i, video["mpd_file"], video["mpd_file"])
+            for i, video in enumerate(videos_data)
+        ]
+        cards = "".join(parts)
+    
+    html = _HTML_HEAD + cards.encode("utf-8") + _HTML_TAIL
+    
+    # Drop the oldest rendered page once the cache is full
+    if len(_html_cache) >= _HTML_CACHE_SIZE:
+        del _html_cache[next(iter(_html_cache))]
+    page = _html_cache[html_key] = (html, gzip.compress(html, mtime=0))
+    
+    return _html_response(request, page)
 
 @app.get("/api/videos")
 async def get_videos_list(request: Request):
@@ -272,24 +535,20 @@ async def get_videos_list(request: Request):
     # Get base URL from request
     base_url = get_base_url(request)
     
-    video_dirs = [d for d in os.listdir("videos") if os.path.isdir(os.path.join("videos", d)) and d != "export"]
-    
-    videos_data = []
-    for video_dir in video_dirs:
-        video_path = os.path.join("videos", video_dir)
-        # Look for master MPD file that matches the directory name
-        master_mpd = os.path.join(video_path, f"{video_dir}.mpd")
-        
-        if os.path.exists(master_mpd):
-            videos_data.append({
-                "name": video_dir,
-                "mpd_file": f"{base_url}/videos/{video_dir}/{video_dir}.mpd",
-                "display_name": video_dir.replace("_", " ").title()
-            })
-    
-    videos_data.sort(key=lambda x: x["name"])
+    _, videos = await _current_videos()
+    videos_data = _videos_data(videos, base_url)
     return {"videos": videos_data}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # One worker per core; loop="auto" picks uvloop wherever uvicorn[standard]
+    # installs it (not on Windows, Cygwin or PyPy). Workers need the app as an
+    # import string
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=os.cpu_count(),
+        loop="auto",
+        http="httptools"
+    )